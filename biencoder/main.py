@@ -1,5 +1,5 @@
 import argparse
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, Request, Response
 from pydantic import BaseModel
 import uvicorn
 from blink.main_dense import load_biencoder, _process_biencoder_dataloader
@@ -9,19 +9,13 @@ import json
 from tqdm import tqdm
 import torch
 import numpy as np
-import base64
 import logging
 from torch.utils.data import DataLoader, SequentialSampler
 from gatenlp import Document
+from gatenlp_vectors import vector_encode, quantize, pack_doc, VECTORS_MEDIA_TYPE
+from gatenlp_delta import delta_doc
 
-def vector_encode(v):
-    s = base64.b64encode(v).decode()
-    return s
-
-def vector_decode(s, dtype=np.float32):
-    buffer = base64.b64decode(s)
-    v = np.frombuffer(buffer, dtype=dtype)
-    return v
+ENCODING_DTYPES = ['float32', 'float16', 'int8']
 
 class Mention(BaseModel):
     label = 'unknown'
@@ -39,11 +33,10 @@ class Entity(BaseModel):
 
 app = FastAPI()
 
-@app.post('/api/blink/biencoder/mention/doc')
-# remember `content-type: application/json`
-async def encode_mention_from_doc(doc: dict = Body(...)):
-    doc = Document.from_dict(doc)
-
+def mention_samples(doc):
+    """
+    Returns the annotation sets to link of `doc` (Document), the blink samples of their mentions and the mentions.
+    """
     annsets_to_link = set([doc.features.get('annsets_to_link', 'entities_merged')])
 
     samples = []
@@ -73,13 +66,39 @@ async def encode_mention_from_doc(doc: dict = Body(...)):
             samples.append(blink_dict)
             mentions.append(mention)
 
+    return annsets_to_link, samples, mentions
+
+def encode_samples(samples):
     dataloader = _process_biencoder_dataloader(
         samples, biencoder.tokenizer, biencoder_params
     )
     encodings = _run_biencoder_mention(biencoder, dataloader)
     if len(encodings) > 0:
         assert encodings[0].dtype == 'float32'
-    encodings = [vector_encode(e) for e in encodings]
+    return encodings
+
+def set_encodings(doc, mentions, encodings, binary=False):
+    """
+    Adds the encodings to the mentions of `doc`. With `binary` they are {'vector': row} references:
+    returns the matrix of the rows (None otherwise).
+    """
+    # float32 encodings are base64 strings, quantized ones {'data', 'dtype', 'scale'} dicts
+    encoding_dtype = doc.features.get('encoding_dtype', args.encoding_dtype)
+    assert encoding_dtype in ENCODING_DTYPES, 'Unsupported encoding dtype {}'.format(encoding_dtype)
+    quantized = [quantize(e, encoding_dtype) for e in encodings]
+
+    vectors = None
+    if binary:
+        vectors = np.stack([q for q, _ in quantized]) if quantized \
+            else np.zeros((0, 0), dtype=encoding_dtype)
+        encodings = [{'vector': i} for i in range(len(quantized))]
+    elif encoding_dtype == 'float32':
+        encodings = [vector_encode(q) for q, _ in quantized]
+    else:
+        encodings = [{'data': vector_encode(q), 'dtype': encoding_dtype} for q, _ in quantized]
+    for enc, (_, scale) in zip(encodings, quantized):
+        if scale is not None:
+            enc['scale'] = scale
 
     for mention, enc in zip(mentions, encodings):
         mention.features['linking'] = {
@@ -90,8 +109,41 @@ async def encode_mention_from_doc(doc: dict = Body(...)):
     if not 'pipeline' in doc.features:
         doc.features['pipeline'] = []
     doc.features['pipeline'].append('biencoder')
+    return vectors
+
+@app.post('/api/blink/biencoder/mention/doc')
+# remember `content-type: application/json`
+# send `accept: application/x-gatenlp-vectors` to get the encodings as a binary attachment
+async def encode_mention_from_doc(request: Request, doc: dict = Body(...)):
+    doc = Document.from_dict(doc)
+
+    annsets_to_link, samples, mentions = mention_samples(doc)
+    encodings = encode_samples(samples)
+
+    binary = VECTORS_MEDIA_TYPE in request.headers.get('accept', '')
+    vectors = set_encodings(doc, mentions, encodings, binary)
+
+    doc = delta_doc(request, doc.to_dict(), annsets_to_link)
+    if binary:
+        return Response(content=pack_doc(doc, vectors), media_type=VECTORS_MEDIA_TYPE)
+    return doc
 
-    return doc.to_dict()
+@app.post('/api/blink/biencoder/mention/doc/batch')
+# a json list of docs, answered with the list of the encoded docs (json only).
+# The mentions of all the docs are encoded together: fuller batches on the GPU
+async def encode_mention_from_docs(request: Request, docs: List[dict] = Body(...)):
+    docs = [Document.from_dict(doc) for doc in docs]
+    found = [mention_samples(doc) for doc in docs]
+
+    encodings = encode_samples([sample for _, samples, _ in found for sample in samples])
+
+    results = []
+    start = 0
+    for doc, (annsets_to_link, samples, mentions) in zip(docs, found):
+        set_encodings(doc, mentions, encodings[start:start + len(samples)])
+        start += len(samples)
+        results.append(delta_doc(request, doc.to_dict(), annsets_to_link))
+    return results
 
 @app.post('/api/blink/biencoder/mention')
 async def encode_mention(samples: List[Mention]):
@@ -180,6 +232,14 @@ if __name__ == '__main__':
         default="models/biencoder_wiki_large.json",
         help="Path to the biencoder configuration.",
     )
+    parser.add_argument(
+        "--encoding-dtype",
+        dest="encoding_dtype",
+        type=str,
+        default="float32",
+        choices=ENCODING_DTYPES,
+        help="dtype of the mention encodings of /mention/doc (can be overridden by the doc feature `encoding_dtype`).",
+    )
     parser.add_argument(
         "--host", type=str, default="127.0.0.1", help="host to listen at",
     )
@@ -0,0 +1,17 @@
+# Shared by the services: copied next to their main.py at build time (build context `common`
+# in docker-compose.yml). Outside docker, add common/ to PYTHONPATH.
+
+# delta responses (see pipelinehelper): only the sets written by the service and the features
+DELTA_HEADER = 'x-gatenlp-delta'
+
+def delta_doc(request, doc, annset_names):
+    """
+    Returns `doc` (dict) or, when the request asks for a delta, its `annset_names` sets and features.
+    """
+    if not request.headers.get(DELTA_HEADER):
+        return doc
+    annotation_sets = doc.get('annotation_sets', {})
+    return {
+        'annotation_sets': {name: annotation_sets[name] for name in annset_names if name in annotation_sets},
+        'features': doc['features']
+    }
@@ -0,0 +1,79 @@
+# Shared by the services: copied next to their main.py at build time (build context `common`
+# in docker-compose.yml). Outside docker, add common/ to PYTHONPATH.
+import base64
+import json
+import struct
+import numpy as np
+from fastapi import Response
+
+def vector_encode(v):
+    s = base64.b64encode(v).decode()
+    return s
+
+def vector_decode(s, dtype=np.float32):
+    buffer = base64.b64decode(s)
+    v = np.frombuffer(buffer, dtype=dtype)
+    return v
+
+def quantize(v, dtype):
+    """
+    Returns the vector converted to dtype (float32, float16 or int8) and its scale.
+    int8 vectors are scaled by max(|v|) / 127, the scale is None for float types.
+    """
+    if dtype == 'int8':
+        scale = float(np.abs(v).max()) / 127 or 1.0
+        return np.round(v / scale).astype(np.int8), scale
+    return v.astype(dtype), None
+
+def encoding_decode(enc, vectors=None):
+    """
+    Decodes a mention encoding to float32. Encodings are either base64 float32 strings,
+    {'data': base64, 'dtype': ..., 'scale': ...} quantized encodings or
+    {'vector': row, 'scale': ...} references to the binary attachment.
+    """
+    if isinstance(enc, str):
+        return vector_decode(enc)
+    if 'vector' in enc:
+        v = vectors[enc['vector']]
+    else:
+        v = vector_decode(enc['data'], enc['dtype'])
+    if enc.get('scale') is not None:
+        # int8
+        return v.astype(np.float32) * np.float32(enc['scale'])
+    return v.astype(np.float32, copy=False)
+
+# binary transport of a gatenlp dict: the encodings are {'vector': row} references to a matrix
+# uint32 header length | json header {'doc': ..., 'vectors': {'dtype': ..., 'shape': ...}} | raw vectors
+VECTORS_MEDIA_TYPE = 'application/x-gatenlp-vectors'
+
+def pack_doc(doc, vectors):
+    vectors = np.ascontiguousarray(vectors)
+    header = json.dumps({
+        'doc': doc,
+        'vectors': {'dtype': str(vectors.dtype), 'shape': list(vectors.shape)}
+    }).encode('utf-8')
+    return struct.pack('<I', len(header)) + header + vectors.tobytes()
+
+def unpack_doc(body):
+    header_len, = struct.unpack_from('<I', body)
+    header = json.loads(body[4:4 + header_len])
+    # zero-copy view on the request body
+    vectors = np.frombuffer(body, dtype=header['vectors']['dtype'], offset=4 + header_len)
+    return header['doc'], vectors.reshape(header['vectors']['shape'])
+
+async def read_doc(request):
+    """
+    Returns (doc, vectors) where vectors is None for JSON requests.
+    """
+    body = await request.body()
+    if request.headers.get('content-type', '').startswith(VECTORS_MEDIA_TYPE):
+        return unpack_doc(body)
+    return json.loads(body), None
+
+def doc_response(doc, vectors):
+    # answer with the same format of the request
+    if vectors is None:
+        # as JSONResponse
+        content = json.dumps(doc, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+        return Response(content=content, media_type='application/json')
+    return Response(content=pack_doc(doc, vectors), media_type=VECTORS_MEDIA_TYPE)
@@ -0,0 +1,73 @@
+import concurrent.futures
+import queue
+import threading
+import time
+import numpy as np
+
+class MicroBatcher:
+    """
+    Collects the encodings of concurrent searches for up to `max_wait` seconds (or until
+    `max_batch` encodings) and runs them as one search per distinct key.
+    `func(encodings, key)` returns one result per encoding.
+    """
+    def __init__(self, func, max_wait, max_batch):
+        self.func = func
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.batches = 0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, encodings, key):
+        """
+        Waits for the results of `encodings` (float32 matrix). `key` must be hashable.
+        """
+        future = concurrent.futures.Future()
+        self._queue.put((encodings, key, future))
+        return future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = batch[0][0].shape[0]
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += item[0].shape[0]
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+            for key, items in groups.items():
+                self.batches += 1
+                self.requests += len(items)
+                try:
+                    results = self.func(np.concatenate([encodings for encodings, _, _ in items]), key)
+                except BaseException as e:
+                    for _, _, future in items:
+                        future.set_exception(e)
+                    continue
+                # back to each request
+                start = 0
+                for encodings, _, future in items:
+                    future.set_result(results[start:start + encodings.shape[0]])
+                    start += encodings.shape[0]
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'requests': self.requests,
+            'requests_per_batch': self.requests / self.batches if self.batches else 0.0
+        }
@@ -0,0 +1,73 @@
+import argparse
+import concurrent.futures
+import time
+import numpy as np
+from blink.indexer.faiss_indexer import DenseFlatIndexer
+from gatenlp import Document
+import main
+from cache import LRUCache
+
+# latency of search_from_doc_topk() on the documents with nothing to search: no mentions,
+# only skipped mentions and mentions searched in an empty index. None of them touches postgres
+# (the benchmark fails if they do); a Document.from_dict/to_dict round trip is the reference.
+
+class NoDatabase:
+    def connection(self):
+        raise AssertionError('postgres queried by an empty search')
+
+def make_doc(n_mentions, vector_size, skip=False):
+    rng = np.random.default_rng(0)
+    doc = Document('x ' * max(n_mentions, 1))
+    annset = doc.annset('entities_merged')
+    for i in range(n_mentions):
+        linking = {'skip': True} if skip else {'encoding': main.vector_encode(rng.standard_normal(vector_size).astype('float32'))}
+        annset.add(2 * i, 2 * i + 1, 'LOC', {'linking': linking})
+    return doc.to_dict()
+
+def timeit(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def round_trip(doc):
+    Document.from_dict(doc).to_dict()
+
+def run(args):
+    main.args = argparse.Namespace(index_timeout=0)
+    main.dbpool = NoDatabase()
+    main.entity_cache = LRUCache(0)
+    main.query_cache = LRUCache(0)
+    main.search_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    indexer = DenseFlatIndexer(args.vector_size)
+    main.indexes = {0: {'indexer': indexer, 'indexid': 0, 'index_type': 'flat', 'norms': np.zeros(0, dtype=np.float32)}}
+
+    cases = [('no mentions', make_doc(0, args.vector_size))]
+    cases.append(('skipped x{}'.format(args.mentions), make_doc(args.mentions, args.vector_size, skip=True)))
+    for n in [1, args.mentions]:
+        cases.append(('empty index x{}'.format(n), make_doc(n, args.vector_size)))
+
+    for name, doc in cases:
+        # search_from_doc_topk changes the features of the doc it returns
+        t = timeit(lambda: main.search_from_doc_topk(args.top_k, {**doc, 'features': {}}), args.repeat)
+        t_ref = timeit(lambda: round_trip(doc), args.repeat)
+        print('{:18} search_from_doc_topk={:.3f}ms from_dict/to_dict={:.3f}ms'.format(name, t * 1000, t_ref * 1000))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--mentions", type=int, default=2000, help="number of mentions of the big documents",
+    )
+    parser.add_argument(
+        "--top-k", type=int, default=10, help="candidates per mention", dest="top_k",
+    )
+    parser.add_argument(
+        "--vector-size", type=int, default=1024, help="The size of the vectors", dest="vector_size",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="runs per case (best is reported)",
+    )
+
+    run(parser.parse_args())
@@ -0,0 +1,95 @@
+import argparse
+import time
+import numpy as np
+import faiss
+from build_index import new_index
+# the biencoder and indexer helpers (common/gatenlp_vectors.py)
+from gatenlp_vectors import quantize, vector_encode, encoding_decode
+
+# recall@k of quantized mention encodings (float16, int8) and quantized KB indexes (sq8, pq)
+# against the float32 flat index, with the size of encodings and indexes
+
+def recall(gt, candidates, k):
+    # fraction of the float32 top k found in the top k
+    return np.mean([len(set(g[:k]) & set(c[:k])) / k for g, c in zip(gt, candidates)])
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    if args.vectors:
+        kb = np.ascontiguousarray(np.load(args.vectors), dtype=np.float32)
+    else:
+        kb = rng.standard_normal((args.kb_size, args.vector_size)).astype('float32')
+    dim = kb.shape[1]
+    if args.queries:
+        queries = np.ascontiguousarray(np.load(args.queries), dtype=np.float32)
+    else:
+        # noisy copies of kb entities: queries with a meaningful nearest neighbour
+        rows = rng.choice(kb.shape[0], size=args.queries_size)
+        queries = kb[rows] + 0.5 * rng.standard_normal((args.queries_size, dim)).astype('float32')
+
+    flat = faiss.IndexFlatIP(dim)
+    flat.add(kb)
+    _, gt = flat.search(queries, args.top_k)
+    flat_size = faiss.serialize_index(flat).nbytes
+
+    print('mention encodings (flat KB)')
+    for dtype in ['float32', 'float16', 'int8']:
+        quantized = [quantize(q, dtype) for q in queries]
+        # as sent by the biencoder and decoded by the indexer
+        encodings = [{'data': vector_encode(q), 'dtype': dtype, 'scale': scale} for q, scale in quantized]
+        decoded = np.stack([encoding_decode(enc) for enc in encodings])
+        _, candidates = flat.search(decoded, args.top_k)
+        json_size = np.mean([len(enc['data']) for enc in encodings])
+        print('  {:8} recall@{}={:.4f} base64={:.0f}B binary={}B'.format(
+            dtype, args.top_k, recall(gt, candidates, args.top_k), json_size, quantized[0][0].nbytes))
+
+    print('KB indexes (float32 encodings)')
+    print('  {:8} recall@{}={:.4f} size={:.1f}MB'.format('flat', args.top_k, 1.0, flat_size / 2**20))
+    for index_type in ['sq8', 'pq']:
+        index = new_index(index_type, dim, args)
+        start = time.time()
+        if not index.is_trained:
+            index.train(kb[:args.train_size])
+        index.add(kb)
+        build_time = time.time() - start
+        start = time.time()
+        _, candidates = index.search(queries, args.top_k)
+        search_time = time.time() - start
+        size = faiss.serialize_index(index).nbytes
+        print('  {:8} recall@{}={:.4f} size={:.1f}MB build={:.1f}s search={:.3f}s'.format(
+            index_type, args.top_k, recall(gt, candidates, args.top_k), size / 2**20, build_time, search_time))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--vectors", type=str, default=None, help="KB vectors (.npy), random when missing",
+    )
+    parser.add_argument(
+        "--queries", type=str, default=None, help="mention encodings (.npy), noisy KB vectors when missing",
+    )
+    parser.add_argument(
+        "--kb-size", type=int, default=50000, help="number of random entities", dest="kb_size",
+    )
+    parser.add_argument(
+        "--queries-size", type=int, default=1000, help="number of random queries", dest="queries_size",
+    )
+    parser.add_argument(
+        "--vector-size", type=int, default=1024, help="The size of the random vectors", dest="vector_size",
+    )
+    parser.add_argument(
+        "--top-k", type=int, default=10, help="k of recall@k", dest="top_k",
+    )
+    parser.add_argument(
+        "--pq-m", type=int, default=64, help="pq: number of sub-quantizers", dest="pq_m",
+    )
+    parser.add_argument(
+        "--pq-nbits", type=int, default=8, help="pq: bits per sub-quantizer code", dest="pq_nbits",
+    )
+    parser.add_argument(
+        "--train-size", type=int, default=50000, help="vectors used to train the quantizers", dest="train_size",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="random seed",
+    )
+
+    main(parser.parse_args())
@@ -0,0 +1,92 @@
+import argparse
+import time
+import numpy as np
+from blink.indexer.faiss_indexer import DenseFlatIndexer, DenseHNSWFlatIndexer
+from main import candidate_scores, compute_norms, hnsw_phi
+
+# compares the per-candidate loop previously used in search() with
+# candidate_scores(), which relies on precomputed norms, on random flat and hnsw indexes
+
+def legacy_candidate_scores(index, encodings, scores, candidates):
+    indexer = index['indexer']
+    _scores = np.zeros(candidates.shape, dtype=np.float32)
+    _norm_scores = np.zeros(candidates.shape, dtype=np.float32)
+    for n, (_raws, _cands, _enc) in enumerate(zip(scores, candidates, encodings)):
+        for k, (_score, _cand) in enumerate(zip(_raws, _cands)):
+            _cand = int(_cand)
+            if _cand == -1:
+                break
+            if index['index_type'] == 'flat':
+                embedding = indexer.index.reconstruct(_cand)
+            elif index['index_type'] == 'hnsw':
+                embedding = indexer.index.reconstruct(_cand)[:-1]
+                _score = np.inner(_enc, embedding)
+            _enc_norm = np.linalg.norm(_enc)
+            _embedding_norm = np.linalg.norm(embedding)
+            _norm_factor = max(_enc_norm, _embedding_norm)**2
+            _scores[n, k] = _score
+            _norm_scores[n, k] = _score / _norm_factor
+    return _scores, _norm_scores
+
+def timeit(func, repeat, *args):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, res
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    kb = rng.standard_normal((args.kb_size, args.vector_size)).astype('float32')
+    encodings = rng.standard_normal((args.mentions, args.vector_size)).astype('float32')
+
+    for index_type in args.index_types.split(','):
+        if index_type == 'flat':
+            indexer = DenseFlatIndexer(args.vector_size)
+        elif index_type == 'hnsw':
+            indexer = DenseHNSWFlatIndexer(args.vector_size)
+        else:
+            raise ValueError('Unsupported index type {}'.format(index_type))
+        indexer.index_data(kb)
+        index = {'indexer': indexer, 'index_type': index_type}
+        index['norms'] = compute_norms(indexer, index_type)
+        if index_type == 'hnsw':
+            index['phi'] = hnsw_phi(indexer)
+
+        scores, candidates = indexer.search_knn(encodings, args.top_k)
+
+        t_old, (old_scores, old_norm) = timeit(legacy_candidate_scores, args.repeat, index, encodings, scores, candidates)
+        t_new, (new_scores, new_norm) = timeit(candidate_scores, args.repeat, index, encodings, scores, candidates)
+
+        assert np.allclose(old_scores, new_scores, rtol=1e-4, atol=1e-3)
+        assert np.allclose(old_norm, new_norm, rtol=1e-4, atol=1e-5)
+
+        print('{:5} mentions={} top_k={} legacy={:.4f}s vectorized={:.4f}s speedup={:.1f}x'.format(
+            index_type, args.mentions, args.top_k, t_old, t_new, t_old / t_new))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--index-types", type=str, default="flat,hnsw", help="comma separated index types to benchmark", dest="index_types",
+    )
+    parser.add_argument(
+        "--kb-size", type=int, default=20000, help="number of random entities in the index", dest="kb_size",
+    )
+    parser.add_argument(
+        "--mentions", type=int, default=500, help="number of mentions per search",
+    )
+    parser.add_argument(
+        "--top-k", type=int, default=10, help="candidates per mention", dest="top_k",
+    )
+    parser.add_argument(
+        "--vector-size", type=int, default=1024, help="The size of the vectors", dest="vector_size",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="runs per path (best is reported)",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="random seed",
+    )
+
+    main(parser.parse_args())
@@ -0,0 +1,264 @@
+import argparse
+import os
+import time
+import numpy as np
+import faiss
+import psycopg
+
+# Builds the indexes loaded by main.py (hnsw, sq8, pq, ivfflat, ivfpq, opq) from an existing
+# flat index or from a .npy dump of the entity vectors (ids are the row numbers).
+# The exact norms are saved in the <output>.norms.npy sidecar used by main.py.
+# With --compact, rebuilds an index without the vectors deleted through /api/indexer/delete
+# (--shard i/N for the shards of a +shard=i/N index: their entity ids are position * N + i).
+
+def open_vectors(path):
+    """
+    Returns (ntotal, dim, get) where get(start, n) returns float32 vectors.
+    """
+    if path.endswith('.npy'):
+        vectors = np.load(path, mmap_mode='r')
+        def get(start, n):
+            return np.ascontiguousarray(vectors[start:start + n], dtype=np.float32)
+        return vectors.shape[0], vectors.shape[1], get
+    else:
+        index = faiss.read_index(path)
+        assert index.metric_type == faiss.METRIC_INNER_PRODUCT, 'Error! Expected a flat inner product index.'
+        def get(start, n):
+            return index.reconstruct_n(start, n)
+        return index.ntotal, index.d, get
+
+def training_sample(ntotal, get, size, seed=0, batch_size=10000):
+    if size >= ntotal:
+        return get(0, ntotal)
+    # contiguous chunks at random offsets: much faster than single rows on mmapped dumps
+    rng = np.random.default_rng(seed)
+    starts = rng.choice(ntotal // batch_size + 1, size=size // batch_size + 1, replace=False) * batch_size
+    sample = np.concatenate([get(int(start), min(batch_size, ntotal - int(start))) for start in sorted(starts)])
+    return sample[:size]
+
+IVF_INDEX_TYPES = ['ivfflat', 'ivfpq', 'opq']
+
+def index_factory_string(index_type, args):
+    if index_type == 'sq8':
+        return 'SQ8'
+    elif index_type == 'pq':
+        return 'PQ{}x{}'.format(args.pq_m, args.pq_nbits)
+    elif index_type == 'ivfflat':
+        return 'IVF{},Flat'.format(args.nlist)
+    elif index_type == 'ivfpq':
+        return 'IVF{},PQ{}x{}'.format(args.nlist, args.pq_m, args.pq_nbits)
+    elif index_type == 'opq':
+        # rotation learned to balance the pq sub-vectors
+        return 'OPQ{},IVF{},PQ{}x{}'.format(args.pq_m, args.nlist, args.pq_m, args.pq_nbits)
+    else:
+        raise ValueError('Error! Unsupported index type {}.'.format(index_type))
+
+def new_index(index_type, dim, args):
+    if index_type == 'hnsw':
+        # same layout of blink DenseHNSWFlatIndexer: L2 on vectors augmented with one dimension
+        index = faiss.IndexHNSWFlat(dim + 1, args.hnsw_m)
+        index.hnsw.efSearch = args.ef_search
+        index.hnsw.efConstruction = args.ef_construction
+        return index
+    index = faiss.index_factory(dim, index_factory_string(index_type, args), faiss.METRIC_INNER_PRODUCT)
+    if index_type in IVF_INDEX_TYPES:
+        # default nprobe, saved with the index (can be changed per request)
+        faiss.ParameterSpace().set_index_parameter(index, 'nprobe', args.nprobe)
+    return index
+
+def build(args):
+    ntotal, dim, get = open_vectors(args.input)
+    print('Building {} index of {} vectors of size {}...'.format(args.type, ntotal, dim))
+    index = new_index(args.type, dim, args)
+
+    if not index.is_trained:
+        start = time.time()
+        sample = training_sample(ntotal, get, args.train_size, args.seed)
+        print('Training on {} vectors...'.format(sample.shape[0]))
+        index.train(sample)
+        print('Trained in {:.1f}s.'.format(time.time() - start))
+
+    norms = np.empty(ntotal, dtype=np.float32)
+    if args.type == 'hnsw':
+        # phi (max squared norm) is required before adding any vector
+        for start in range(0, ntotal, args.batch_size):
+            batch = get(start, min(args.batch_size, ntotal - start))
+            norms[start:start + batch.shape[0]] = np.linalg.norm(batch, axis=1)
+        phi = float(np.square(norms.astype(np.float64)).max()) if ntotal else 0.0
+
+    for start in range(0, ntotal, args.batch_size):
+        batch = get(start, min(args.batch_size, ntotal - start))
+        norms[start:start + batch.shape[0]] = np.linalg.norm(batch, axis=1)
+        if args.type == 'hnsw':
+            aux = np.sqrt(np.maximum(phi - np.square(norms[start:start + batch.shape[0]].astype(np.float64)), 0))
+            batch = np.hstack((batch, aux.astype(np.float32).reshape(-1, 1)))
+        index.add(batch)
+        print('Added {}/{}'.format(start + batch.shape[0], ntotal))
+
+    faiss.write_index(index, args.output)
+    # same sidecar as main.norms_path
+    np.save(args.output + '.norms.npy', norms)
+    print('Saved {} ({:.1f} MB).'.format(args.output, os.path.getsize(args.output) / 2**20))
+
+def compact(args):
+    """
+    Drops the tombstoned vectors: the following ids shift down (postgres is updated with --postgres).
+    The indexer must not be running.
+    """
+    assert os.path.abspath(args.output) != os.path.abspath(args.input), 'Error. --output must differ from --input.'
+    index = faiss.read_index(args.input)
+    ntotal = index.ntotal
+    # same sidecars as main.tombstones_path and main.norms_path
+    tombstones = np.load(args.input + '.tombstones.npy')
+    tombstones = np.unique(tombstones[tombstones < ntotal]).astype(np.int64)
+    keep = np.ones(ntotal, dtype=bool)
+    keep[tombstones] = False
+    old_ids = np.flatnonzero(keep)
+    print('Compacting {}: {} of {} vectors deleted.'.format(args.input, tombstones.shape[0], ntotal))
+
+    if isinstance(index, faiss.IndexFlatCodes):
+        # flat, sq8, pq: the codes are removed in place (ids shift down)
+        index.remove_ids(faiss.IDSelectorBatch(tombstones))
+    else:
+        # hnsw, ivf: same training and parameters, the kept vectors are added again
+        if isinstance(index, (faiss.IndexIVF, faiss.IndexPreTransform)):
+            faiss.extract_index_ivf(index).make_direct_map()
+        compacted = faiss.clone_index(index)
+        compacted.reset()
+        for start in range(0, old_ids.shape[0], args.batch_size):
+            compacted.add(index.reconstruct_batch(old_ids[start:start + args.batch_size]))
+            print('Added {}/{}'.format(min(start + args.batch_size, old_ids.shape[0]), old_ids.shape[0]))
+        index = compacted
+    assert index.ntotal == old_ids.shape[0]
+
+    faiss.write_index(index, args.output)
+    norms_path = args.input + '.norms.npy'
+    if os.path.isfile(norms_path):
+        norms = np.load(norms_path)
+        if norms.shape[0] == ntotal:
+            np.save(args.output + '.norms.npy', norms[keep])
+    np.save(args.output + '.tombstones.npy', np.zeros(0, dtype=np.int64))
+    print('Saved {} ({} vectors). Export again its entity store if any.'.format(args.output, index.ntotal))
+
+    # last: the input index is still consistent with postgres if anything above fails
+    if args.postgres is not None:
+        assert args.indexer is not None, 'Error. --indexer is required with --postgres.'
+        with psycopg.connect(args.postgres) as dbconnection:
+            remap_entities(dbconnection, args.indexer, tombstones, old_ids, args.shard)
+        print('Updated the ids of indexer {} in postgres. Use {} from now on.'.format(args.indexer, args.output))
+    else:
+        print('Warning! Postgres not updated: the entity ids must be remapped (see --postgres).')
+
+def to_global(ids, shard):
+    # positions in the index --> entity ids (as main.to_global)
+    if shard is None:
+        return ids
+    shard_no, num_shards = shard
+    return ids * num_shards + shard_no
+
+def remap_entities(dbconnection, indexid, tombstones, old_ids, shard=None):
+    # entity at position old_ids[i] gets position i, in one transaction
+    new_ids = to_global(np.arange(old_ids.shape[0], dtype=np.int64), shard)
+    old_ids = to_global(old_ids, shard)
+    tombstones = to_global(tombstones, shard)
+    with dbconnection.cursor() as cur:
+        cur.execute("""
+            DELETE
+            FROM
+                entities
+            WHERE
+                indexer = %s AND
+                id = ANY(%s);
+            """, (indexid, tombstones.tolist()))
+        cur.execute("CREATE TEMPORARY TABLE id_map (old_id INT PRIMARY KEY, new_id INT) ON COMMIT DROP;")
+        with cur.copy("COPY id_map (old_id, new_id) FROM STDIN") as copy:
+            for new_id, old_id in zip(new_ids.tolist(), old_ids.tolist()):
+                if new_id != old_id:
+                    copy.write_row((old_id, new_id))
+        # through negative ids: the primary key is checked on every updated row
+        cur.execute("""
+            UPDATE
+                entities
+            SET
+                id = -1 - id_map.new_id
+            FROM
+                id_map
+            WHERE
+                entities.indexer = %s AND
+                entities.id = id_map.old_id;
+            """, (indexid,))
+        cur.execute("""
+            UPDATE
+                entities
+            SET
+                id = -1 - id
+            WHERE
+                indexer = %s AND
+                id < 0;
+            """, (indexid,))
+    dbconnection.commit()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--input", type=str, required=True, help="flat index or .npy vectors (row i is the entity with id i)",
+    )
+    parser.add_argument(
+        "--output", type=str, required=True, help="path of the new index",
+    )
+    parser.add_argument(
+        "--type", type=str, default=None, choices=['hnsw', 'sq8', 'pq'] + IVF_INDEX_TYPES, help="index type",
+    )
+    parser.add_argument(
+        "--compact", action="store_true", default=False, help="rebuild --input (any type) without its tombstoned vectors",
+    )
+    parser.add_argument(
+        "--postgres", type=str, default=None, help="compact: postgres url, to remap the ids of the entities",
+    )
+    parser.add_argument(
+        "--indexer", type=int, default=None, help="compact: indexer id of the index",
+    )
+    parser.add_argument(
+        "--shard", type=str, default=None, help="compact: i/N when --input is shard i of N (+shard=i/N in main.py)",
+    )
+    parser.add_argument(
+        "--nlist", type=int, default=4096, help="ivf: number of inverted lists (about 4 * sqrt(ntotal))",
+    )
+    parser.add_argument(
+        "--nprobe", type=int, default=32, help="ivf: default number of lists visited at search time",
+    )
+    parser.add_argument(
+        "--hnsw-m", type=int, default=128, help="hnsw: neighbours per node", dest="hnsw_m",
+    )
+    parser.add_argument(
+        "--ef-construction", type=int, default=200, help="hnsw: efConstruction", dest="ef_construction",
+    )
+    parser.add_argument(
+        "--ef-search", type=int, default=256, help="hnsw: default efSearch (can be changed per request)", dest="ef_search",
+    )
+    parser.add_argument(
+        "--pq-m", type=int, default=64, help="pq: number of sub-quantizers (must divide the vector size)", dest="pq_m",
+    )
+    parser.add_argument(
+        "--pq-nbits", type=int, default=8, help="pq: bits per sub-quantizer code", dest="pq_nbits",
+    )
+    parser.add_argument(
+        "--train-size", type=int, default=200000, help="number of vectors used for training", dest="train_size",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=100000, help="vectors added per batch", dest="batch_size",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="random seed for the training sample",
+    )
+
+    args = parser.parse_args()
+    if args.shard is not None:
+        shard_no, num_shards = [int(x) for x in args.shard.split('/')]
+        assert 0 <= shard_no < num_shards, 'Error. --shard must be i/N with 0 <= i < N.'
+        args.shard = (shard_no, num_shards)
+    if args.compact:
+        compact(args)
+    else:
+        assert args.type is not None, 'Error. --type is required.'
+        build(args)
@@ -0,0 +1,98 @@
+import time
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an optional time to live (seconds).
+    A cache with maxsize 0 is disabled: every lookup is a miss.
+    """
+    def __init__(self, maxsize=100000, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # incremented by invalidate()
+        self.generation = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, inserted):
+        return self.ttl is not None and self.ttl > 0 and time.monotonic() - inserted > self.ttl
+
+    def _get(self, key):
+        # caller holds the lock
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, inserted = item
+        if self._expired(inserted):
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return item
+
+    def get_many(self, keys):
+        """
+        Returns the dict of cached values and the list of missing keys.
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                item = self._get(key)
+                if item is None:
+                    missing.append(key)
+                else:
+                    found[key] = item[0]
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def get(self, key, default=None):
+        found, _ = self.get_many([key])
+        return found.get(key, default)
+
+    def put_many(self, items, generation=None):
+        """
+        With `generation`, the items are dropped when the cache was invalidated since then
+        (they may be computed from stale data).
+        """
+        if self.maxsize <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            for key, value in items:
+                self._data[key] = (value, now)
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def put(self, key, value):
+        self.put_many([(key, value)])
+
+    def invalidate(self, predicate=None):
+        """
+        Removes the keys matching `predicate` (all the keys when None).
+        """
+        with self._lock:
+            self.generation += 1
+            if predicate is None:
+                self._data.clear()
+            else:
+                for key in [k for k in self._data if predicate(k)]:
+                    del self._data[key]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0
+            }
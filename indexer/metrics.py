@@ -0,0 +1,82 @@
+import time
+from contextlib import contextmanager
+try:
+    import prometheus_client
+    from prometheus_client.core import GaugeMetricFamily, REGISTRY
+except ImportError:
+    # /metrics is disabled, the instrumentation does nothing
+    prometheus_client = None
+
+# Prometheus metrics of the indexer (served by /metrics).
+# Latencies are in seconds; the gauges (index sizes, caches, ...) are read at every scrape.
+
+enabled = prometheus_client is not None
+
+# small searches are a few ms, big batches or cold postgres seconds
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+class _Noop:
+    def labels(self, *args, **kwargs):
+        return self
+    def observe(self, value):
+        pass
+    def inc(self, value=1):
+        pass
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    if not enabled:
+        return _Noop()
+    return prometheus_client.Histogram(name, documentation, labelnames, buckets=buckets)
+
+def counter(name, documentation, labelnames=()):
+    if not enabled:
+        return _Noop()
+    return prometheus_client.Counter(name, documentation, labelnames)
+
+REQUESTS = counter('indexer_requests', 'HTTP requests', ['endpoint', 'status'])
+REQUEST_LATENCY = histogram('indexer_request_seconds', 'HTTP request latency', ['endpoint'])
+STAGE_LATENCY = histogram('indexer_stage_seconds', 'Latency of the stages of a search/doc request (parse, decode, search, annotate, serialize)', ['stage'])
+SEARCH_LATENCY = histogram('indexer_index_search_seconds', 'faiss (or remote) search latency of each index', ['indexer'])
+DB_LATENCY = histogram('indexer_db_seconds', 'Postgres query latency', ['query'])
+POSTPROCESS_LATENCY = histogram('indexer_postprocess_seconds', 'Scores and candidate dicts of the results of each index', ['indexer'])
+SEARCH_SIZE = histogram('indexer_search_encodings', 'Encodings per search (after the micro-batcher)', buckets=SIZE_BUCKETS)
+
+@contextmanager
+def timed(metric, timings=None, key=None):
+    """
+    Observes the seconds spent in the block and, with `timings`, adds them (ms) to timings[key].
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metric.observe(elapsed)
+        if timings is not None:
+            timings[key] = timings.get(key, 0.0) + elapsed * 1000
+
+class _GaugeCollector:
+    def __init__(self, func):
+        self.func = func
+
+    def collect(self):
+        families = {}
+        for name, documentation, labels, value in self.func():
+            if name not in families:
+                families[name] = GaugeMetricFamily(name, documentation, labels=list(labels))
+            families[name].add_metric([str(labels[k]) for k in labels], value)
+        return list(families.values())
+
+def register_gauges(func):
+    """
+    `func()` yields (name, documentation, labels dict, value) at every scrape.
+    """
+    if enabled:
+        REGISTRY.register(_GaugeCollector(func))
+
+def exposition():
+    """
+    Returns the metrics in the Prometheus text format and their content type.
+    """
+    return prometheus_client.generate_latest(), prometheus_client.CONTENT_TYPE_LATEST
@@ -0,0 +1,233 @@
+import argparse
+import json
+import sqlite3
+import threading
+import time
+import requests
+import psycopg
+from cache import LRUCache
+
+# Local store of the wikipedia properties (extract, thumbnail, ...) shown by /api/indexer/info.
+# Lookups go through an in-memory LRU cache, then the sqlite file, then (optionally) the live
+# wikipedia api, whose answers are written back to the file.
+#   props(wikipedia_id INTEGER PRIMARY KEY, props TEXT (json page), updated REAL (unix time))
+
+WIKIPEDIA_API = 'https://{}.wikipedia.org/w/api.php'
+# the api returns at most 20 extracts per request
+FETCH_BATCH_SIZE = 20
+
+def fetch_props(language, wikipedia_ids, timeout=10):
+    """
+    Fetches the pages of `wikipedia_ids` from the wikipedia api. Returns {wikipedia_id: page}.
+    """
+    params = {
+        'action': 'query',
+        'pageids': '|'.join(str(i) for i in wikipedia_ids),
+        'prop': 'extracts|pageimages',
+        'exchars': 200,
+        'exlimit': FETCH_BATCH_SIZE,
+        'explaintext': 'true',
+        'pithumbsize': 480,
+        'format': 'json'
+    }
+    res = requests.get(WIKIPEDIA_API.format(language), params=params, timeout=timeout)
+    if not res.ok:
+        return {}
+    pages = res.json().get('query', {}).get('pages', {})
+    return {int(k): v for k, v in pages.items()}
+
+class PropsStore:
+    def __init__(self, path=None, language='en', live=True, cache_size=100000, cache_ttl=None):
+        self.path = path
+        self.language = language
+        self.live = live
+        self.cache = LRUCache(cache_size, cache_ttl)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.refresher = None
+        self.db = None
+        if path is not None:
+            # shared by the request threads, serialized by the lock
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute('PRAGMA journal_mode=WAL;')
+            self.db.execute('CREATE TABLE IF NOT EXISTS props (wikipedia_id INTEGER PRIMARY KEY, props TEXT, updated REAL);')
+            self.db.commit()
+
+    def _read(self, wikipedia_ids):
+        if self.db is None or not wikipedia_ids:
+            return {}
+        found = {}
+        with self._lock:
+            # sqlite limits the number of query parameters
+            for start in range(0, len(wikipedia_ids), 500):
+                chunk = wikipedia_ids[start:start + 500]
+                rows = self.db.execute(
+                    'SELECT wikipedia_id, props FROM props WHERE wikipedia_id IN ({});'.format(','.join('?' * len(chunk))),
+                    chunk).fetchall()
+                for wikipedia_id, props in rows:
+                    found[wikipedia_id] = json.loads(props)
+        return found
+
+    def put_many(self, items):
+        """
+        Stores (wikipedia_id, props) pairs in the file and in the cache.
+        """
+        items = list(items)
+        if self.db is not None and items:
+            now = time.time()
+            with self._lock:
+                self.db.executemany(
+                    'INSERT OR REPLACE INTO props (wikipedia_id, props, updated) VALUES (?, ?, ?);',
+                    [(wikipedia_id, json.dumps(props), now) for wikipedia_id, props in items])
+                self.db.commit()
+        self.cache.put_many(items)
+
+    def _fetch(self, wikipedia_ids):
+        fetched = {}
+        for start in range(0, len(wikipedia_ids), FETCH_BATCH_SIZE):
+            try:
+                fetched.update(fetch_props(self.language, wikipedia_ids[start:start + FETCH_BATCH_SIZE]))
+            except requests.RequestException as e:
+                print('Wikipedia props error', e)
+        return fetched
+
+    def get_many(self, wikipedia_ids):
+        """
+        Returns {wikipedia_id: props}. Unknown ids (or ids <= 0) get {}.
+        """
+        wikipedia_ids = [int(i) for i in set(wikipedia_ids) if i is not None and i > 0]
+        found, missing = self.cache.get_many(wikipedia_ids)
+        if missing:
+            stored = self._read(missing)
+            self.cache.put_many(stored.items())
+            found.update(stored)
+            missing = [i for i in missing if i not in stored]
+        if missing and self.live:
+            fetched = self._fetch(missing)
+            self.put_many(fetched.items())
+            found.update(fetched)
+        return found
+
+    def get(self, wikipedia_id):
+        return self.get_many([wikipedia_id]).get(wikipedia_id, {})
+
+    def stats(self):
+        stats = {'live': self.live, 'cache': self.cache.stats()}
+        if self.db is not None:
+            with self._lock:
+                stats['stored'] = self.db.execute('SELECT count(*) FROM props;').fetchone()[0]
+        return stats
+
+    def refresh(self, max_age, limit=1000):
+        """
+        Fetches again the `limit` oldest props updated more than `max_age` seconds ago.
+        """
+        if self.db is None or not self.live:
+            return 0
+        with self._lock:
+            rows = self.db.execute(
+                'SELECT wikipedia_id FROM props WHERE updated < ? ORDER BY updated LIMIT ?;',
+                (time.time() - max_age, limit)).fetchall()
+        fetched = self._fetch([r[0] for r in rows])
+        self.put_many(fetched.items())
+        return len(fetched)
+
+    def start_refresher(self, interval, max_age, limit=1000):
+        # daemon thread: requests never wait for the refresh
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    n = self.refresh(max_age, limit)
+                    if n:
+                        print('Refreshed {} wikipedia props.'.format(n))
+                except Exception as e:
+                    print('Props refresh error', e)
+        self.refresher = threading.Thread(target=loop, daemon=True)
+        self.refresher.start()
+
+    def close(self):
+        self._stop.set()
+        if self.db is not None:
+            with self._lock:
+                self.db.close()
+
+def import_jsonl(store, path, batch_size=10000):
+    """
+    Imports wikipedia pages (one json page per line, as returned by the api, with `pageid`).
+    """
+    n = 0
+    batch = []
+    with open(path) as fd:
+        for line in fd:
+            if not line.strip():
+                continue
+            page = json.loads(line)
+            batch.append((int(page['pageid']), page))
+            if len(batch) >= batch_size:
+                store.put_many(batch)
+                n += len(batch)
+                batch = []
+    store.put_many(batch)
+    return n + len(batch)
+
+def import_from_wikipedia(store, dbconnection, indexid, batch_size=1000):
+    """
+    Fetches from the wikipedia api the props of the entities of `indexid` not yet stored.
+    """
+    n = 0
+    with dbconnection.cursor(name='props_store_import') as cur:
+        cur.execute("""
+            SELECT DISTINCT
+                wikipedia_id
+            FROM
+                entities
+            WHERE
+                indexer = %s AND
+                wikipedia_id > 0;
+            """, (indexid,))
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            wikipedia_ids = [r[0] for r in rows]
+            stored = store._read(wikipedia_ids)
+            fetched = store._fetch([i for i in wikipedia_ids if i not in stored])
+            store.put_many(fetched.items())
+            n += len(fetched)
+            print('Fetched {} props.'.format(n))
+    dbconnection.commit()
+    return n
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Populate the wikipedia props store used by /api/indexer/info.')
+    parser.add_argument(
+        "--db", type=str, required=True, help="path of the sqlite props store",
+    )
+    parser.add_argument(
+        "--input", type=str, default=None, help="jsonl of wikipedia pages (one api page with `pageid` per line)",
+    )
+    parser.add_argument(
+        "--postgres", type=str, default=None, help="postgres url: fetch the props of the entities of --indexer from wikipedia",
+    )
+    parser.add_argument(
+        "--indexer", type=int, default=None, help="indexer id whose entities are fetched",
+    )
+    parser.add_argument(
+        "--language", type=str, default="en", help="Wikipedia language (en,it,...).",
+    )
+
+    args = parser.parse_args()
+
+    assert args.input is not None or args.postgres is not None, 'Error. Either --input or --postgres is required.'
+
+    # no need to cache what is only written
+    store = PropsStore(args.db, language=args.language, live=True, cache_size=0)
+    if args.input is not None:
+        n = import_jsonl(store, args.input)
+        print('Imported {} props from {}.'.format(n, args.input))
+    if args.postgres is not None:
+        assert args.indexer is not None, 'Error. --indexer is required with --postgres.'
+        with psycopg.connect(args.postgres) as dbconnection:
+            n = import_from_wikipedia(store, dbconnection, args.indexer)
+        print('Fetched {} props from wikipedia.'.format(n))
+    store.close()
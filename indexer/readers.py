@@ -0,0 +1,51 @@
+import threading
+from collections import Counter
+
+class Readers:
+    """
+    Tracks the searches in flight by epoch (RCU style): readers never wait for the writer,
+    the writer waits (synchronize) for the readers that may still use an object it unpublished.
+    """
+    def __init__(self):
+        self.epoch = 0
+        self._active = Counter()
+        self._cond = threading.Condition()
+
+    def enter(self):
+        with self._cond:
+            self._active[self.epoch] += 1
+            return self.epoch
+
+    def exit(self, token):
+        with self._cond:
+            self._active[token] -= 1
+            if self._active[token] == 0:
+                del self._active[token]
+                self._cond.notify_all()
+
+    def exit_when_done(self, token, futures):
+        """
+        Calls exit(token) once all `futures` are done (they may outlive a timed out search).
+        """
+        if not futures:
+            self.exit(token)
+            return
+        lock = threading.Lock()
+        pending = [len(futures)]
+        def done(_):
+            with lock:
+                pending[0] -= 1
+                last = pending[0] == 0
+            if last:
+                self.exit(token)
+        for future in futures:
+            future.add_done_callback(done)
+
+    def synchronize(self):
+        """
+        Waits for the readers entered before this call.
+        """
+        with self._cond:
+            self.epoch += 1
+            target = self.epoch
+            self._cond.wait_for(lambda: all(epoch >= target for epoch in self._active))
@@ -0,0 +1,126 @@
+import os
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+
+# Append-only log of the vectors added to the rw index since its last snapshot.
+# Each record is: header (first id, number of vectors, vector size) | float32 vectors | crc32.
+# A snapshot rotates the log to <log>.old, writes the index and then deletes <log>.old:
+# after a crash both logs are replayed (records already in the index file are skipped).
+
+HEADER = struct.Struct('<QII')
+CRC = struct.Struct('<I')
+
+def read_records(path):
+    """
+    Returns the valid (first_id, vectors) records of the log and the offset where they end.
+    A truncated or corrupted record (e.g. a crash while writing) ends the log.
+    """
+    records = []
+    end = 0
+    with open(path, 'rb') as fd:
+        data = fd.read()
+    while end + HEADER.size <= len(data):
+        first_id, n, dim = HEADER.unpack_from(data, end)
+        payload_start = end + HEADER.size
+        payload_end = payload_start + n * dim * 4
+        if payload_end + CRC.size > len(data):
+            break
+        payload = data[payload_start:payload_end]
+        crc, = CRC.unpack_from(data, payload_end)
+        if crc != zlib.crc32(payload):
+            break
+        records.append((first_id, np.frombuffer(payload, dtype=np.float32).reshape(n, dim)))
+        end = payload_end + CRC.size
+    return records, end
+
+class VectorLog:
+    def __init__(self, path, fsync_interval=0):
+        """
+        fsync_interval: max seconds between fsyncs (0 to fsync every append).
+        """
+        self.path = path
+        self.old_path = path + '.old'
+        self.fsync_interval = fsync_interval
+        # vectors appended since the last rotation
+        self.pending = 0
+        self._last_fsync = 0
+        self._fd = None
+        self._lock = threading.Lock()
+
+    def replay(self):
+        """
+        Opens the log and returns its records (and those of an interrupted snapshot).
+        """
+        records = []
+        if os.path.isfile(self.old_path):
+            records.extend(read_records(self.old_path)[0])
+        if os.path.isfile(self.path):
+            current, end = read_records(self.path)
+            records.extend(current)
+            if end < os.path.getsize(self.path):
+                print('Dropping a truncated record at the end of {}.'.format(self.path))
+                with open(self.path, 'r+b') as fd:
+                    fd.truncate(end)
+            self.pending = sum(v.shape[0] for _, v in current)
+        self._fd = open(self.path, 'ab')
+        return records
+
+    def _sync(self, force=False):
+        # caller holds the lock
+        self._fd.flush()
+        now = time.monotonic()
+        if force or self.fsync_interval <= 0 or now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._fd.fileno())
+            self._last_fsync = now
+
+    def append(self, first_id, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        payload = vectors.tobytes()
+        record = HEADER.pack(first_id, vectors.shape[0], vectors.shape[1]) + payload + CRC.pack(zlib.crc32(payload))
+        with self._lock:
+            self._fd.write(record)
+            self._sync()
+            self.pending += vectors.shape[0]
+
+    def rotate(self):
+        """
+        Moves the current records to <log>.old (before a snapshot) and starts an empty log.
+        """
+        with self._lock:
+            self._sync(force=True)
+            self._fd.close()
+            if os.path.isfile(self.old_path):
+                # previous snapshot failed: keep its records too
+                with open(self.old_path, 'ab') as old, open(self.path, 'rb') as current:
+                    old.write(current.read())
+                    old.flush()
+                    os.fsync(old.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.old_path)
+            self._fd = open(self.path, 'ab')
+            self.pending = 0
+
+    def discard_rotated(self):
+        """
+        Deletes <log>.old once the snapshot including its records is on disk.
+        """
+        if os.path.isfile(self.old_path):
+            os.remove(self.old_path)
+
+    def truncate(self):
+        with self._lock:
+            self._fd.close()
+            self.discard_rotated()
+            self._fd = open(self.path, 'wb')
+            self.pending = 0
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                self._sync(force=True)
+                self._fd.close()
+                self._fd = None
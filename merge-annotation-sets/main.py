@@ -1,12 +1,13 @@
 import uvicorn
 import argparse
 import pandas as pd
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, Request
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 from pathlib import Path
 from datetime import datetime
 from gatenlp import Document
+from gatenlp_delta import delta_doc
 from merge_sets import create_best_NER_annset
 import json
 
@@ -35,9 +36,9 @@ class Input(BaseModel):
     annset_priority: dict = None
 
 @app.post('/api/mergesets/doc')
-async def run_api_doc(doc: dict = Body(...)):
+async def run_api_doc(request: Request, doc: dict = Body(...)):
     body = Input(doc=doc, merged_name='merged', annset_priority=annset_priority_g)
-    return run(body)
+    return delta_doc(request, run(body), ['entities_' + body.merged_name])
     
 
 @app.post('/api/mergesets')
@@ -2,11 +2,7 @@ from collections import Counter
 import numpy as np
 import pandas as pd
 from sklearn_extra.cluster import KMedoids
-import base64
-
-def vector_encode(v):
-    s = base64.b64encode(v).decode()
-    return s
+from gatenlp_vectors import vector_encode
 
 class DataEvolver:
     def __init__(self, documents, data, step=3, randomly=False, seed=None):
@@ -1,5 +1,5 @@
 import argparse
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, Request
 from pydantic import BaseModel
 import uvicorn
 from typing import List, Optional
@@ -7,20 +7,12 @@ from sklearn.cluster import DBSCAN, AgglomerativeClustering
 from fastDamerauLevenshtein import damerauLevenshtein
 from scipy.spatial.distance import cdist
 import numpy as np
-import base64
 from Packages.TimeEvolving import Cluster, compare_ecoding
 from gatenlp import Document
+from gatenlp_vectors import vector_decode, encoding_decode, read_doc, doc_response
+from gatenlp_delta import delta_doc
 from collections import Counter
 
-def vector_encode(v):
-    s = base64.b64encode(v).decode()
-    return s
-
-def vector_decode(s, dtype=np.float32):
-    buffer = base64.b64decode(s)
-    v = np.frombuffer(buffer, dtype=dtype)
-    return v
-
 def jacc_metric(x, y):
     x = set(x.lower().split())
     y = set(y.lower().split())
@@ -74,7 +66,9 @@ class Item(BaseModel):
 app = FastAPI()
 
 @app.post('/api/nilcluster/doc')
-async def cluster_mention_from_doc(doc: dict = Body(...)):
+# accepts `application/json` or `application/x-gatenlp-vectors`
+async def cluster_mention_from_doc(request: Request):
+    doc, vectors = await read_doc(request)
     doc = Document.from_dict(doc)
 
     annsets_to_link = set([doc.features.get('annsets_to_link', 'entities_merged')])
@@ -97,13 +91,13 @@ async def cluster_mention_from_doc(doc: dict = Body(...)):
                 mention_text = mention.features['mention'] if 'mention' in mention.features \
                                                             else doc.text[mention.start:mention.end]
                 item.mentions.append(mention_text)
-                item.embeddings.append(mention.features['linking']['encoding'])
+                item.embeddings.append(encoding_decode(mention.features['linking']['encoding'], vectors))
                 item.types.append(mention.type)
 
         res_cluster = cluster_mention(item)
         if not res_cluster:
             print('No NIL entities. No clustering required.')
-            return doc.to_dict()
+            return doc_response(delta_doc(request, doc.to_dict(), annsets_to_link), vectors)
 
         current_clusters = []
 
@@ -165,7 +159,7 @@ async def cluster_mention_from_doc(doc: dict = Body(...)):
         doc.features['pipeline'] = []
     doc.features['pipeline'].append('nilclustering')
 
-    return doc.to_dict()
+    return doc_response(delta_doc(request, doc.to_dict(), annsets_to_link), vectors)
 
 @app.post('/api/nilcluster')
 async def cluster_mention_api(item: Item):
@@ -185,7 +179,8 @@ def cluster_mention(item: Item):
         item.embeddings = item.encodings
     elif not item.encodings and not item.embeddings:
         raise Exception('Either "embeddings" or "encodings" field is required.')
-    current_encodings = [vector_decode(e) for e in item.embeddings]
+    # embeddings are already decoded when coming from a document
+    current_encodings = [e if isinstance(e, np.ndarray) else vector_decode(e) for e in item.embeddings]
 
     if not item.types:
         item.types = []
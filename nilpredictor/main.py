@@ -1,6 +1,6 @@
 import pickle
 import pandas as pd
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, Request
 from pydantic import BaseModel
 import uvicorn
 from typing import List, Optional
@@ -8,6 +8,7 @@ import argparse
 import textdistance
 import statistics
 from gatenlp import Document
+from gatenlp_delta import delta_doc
 
 # input: features
 # output: NIL score
@@ -39,10 +40,10 @@ class Features(BaseModel):
 
 app = FastAPI()
 
-@app.post('/api/nilprediction/doc')
-async def nilprediction_doc_api(doc: dict = Body(...)):
-    doc = Document.from_dict(doc)
-
+def mention_features(doc):
+    """
+    Returns the annotation sets to link of `doc` (Document), the features of their mentions and the mentions.
+    """
     annsets_to_link = set([doc.features.get('annsets_to_link', 'entities_merged')])
 
     input = []
@@ -74,8 +75,12 @@ async def nilprediction_doc_api(doc: dict = Body(...)):
             input.append(feat)
             mentions.append(mention)
 
-    nil_results = run(input)
+    return annsets_to_link, input, mentions
 
+def set_nil_scores(doc, mentions, nil_results):
+    """
+    Adds the NIL scores of run() to the mentions of `doc`.
+    """
     score_label = 'nil_score_cross' if 'nil_score_cross' in nil_results else 'nil_score_bi'
     add_score_bi = 'nil_score_cross' in nil_results
 
@@ -99,7 +104,33 @@ async def nilprediction_doc_api(doc: dict = Body(...)):
         doc.features['pipeline'] = []
     doc.features['pipeline'].append('nilprediction')
 
-    return doc.to_dict()
+@app.post('/api/nilprediction/doc')
+async def nilprediction_doc_api(request: Request, doc: dict = Body(...)):
+    doc = Document.from_dict(doc)
+
+    annsets_to_link, input, mentions = mention_features(doc)
+    nil_results = run(input)
+    set_nil_scores(doc, mentions, nil_results)
+
+    return delta_doc(request, doc.to_dict(), annsets_to_link)
+
+@app.post('/api/nilprediction/doc/batch')
+# a json list of docs, answered with the list of the docs with their NIL scores.
+# The mentions of all the docs go through the models together
+async def nilprediction_docs_api(request: Request, docs: List[dict] = Body(...)):
+    docs = [Document.from_dict(doc) for doc in docs]
+    found = [mention_features(doc) for doc in docs]
+
+    nil_results = run([feat for _, input, _ in found for feat in input])
+
+    results = []
+    start = 0
+    for doc, (annsets_to_link, input, mentions) in zip(docs, found):
+        end = start + len(input)
+        set_nil_scores(doc, mentions, {k: v[start:end] for k, v in nil_results.items()})
+        start = end
+        results.append(delta_doc(request, doc.to_dict(), annsets_to_link))
+    return results
 
 @app.post('/api/nilprediction')
 async def nilprediction_api(input: List[Features]):
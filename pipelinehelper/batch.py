@@ -0,0 +1,100 @@
+import argparse
+import collections
+import concurrent.futures
+import os
+import time
+import httpx
+
+# Sends a jsonl corpus (one gatenlp doc per line) through /api/pipeline/batch and writes the
+# annotated docs to --output, one per line in the input order ({"error": ...} for the failed ones).
+# Up to --parallel requests of --chunk-size docs are in flight.
+# Run again with the same output to resume: the docs already written are skipped.
+
+def read_chunks(path, skip, chunk_size):
+    chunk = []
+    n = 0
+    with open(path, 'rb') as fd:
+        for line in fd:
+            if not line.strip():
+                continue
+            n += 1
+            if n <= skip:
+                continue
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+def count_lines(path):
+    if not os.path.isfile(path):
+        return 0
+    with open(path, 'rb') as fd:
+        return sum(1 for line in fd if line.strip())
+
+def send_chunk(client, url, chunk):
+    lines = []
+    with client.stream('POST', url, content=b''.join(chunk), headers={'content-type': 'application/x-ndjson'}) as res:
+        res.raise_for_status()
+        for line in res.iter_lines():
+            if line.strip():
+                lines.append(line)
+    assert len(lines) == len(chunk), 'Error! {} docs sent, {} received.'.format(len(chunk), len(lines))
+    return lines
+
+def run(args):
+    done = count_lines(args.output)
+    if done:
+        print('Resuming after {} docs.'.format(done))
+    url = args.pipeline.rstrip('/') + '/api/pipeline/batch'
+
+    start_time = time.time()
+    written = 0
+    errors = 0
+    with httpx.Client(timeout=args.timeout) as client, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=args.parallel) as executor, \
+            open(args.output, 'a') as out:
+        pending = collections.deque()
+
+        def write_next():
+            nonlocal written, errors
+            for line in pending.popleft().result():
+                out.write(line + '\n')
+                written += 1
+                errors += line.startswith('{"error"')
+            out.flush()
+            elapsed = time.time() - start_time
+            print('{} docs ({:.1f}/s), {} errors.'.format(written, written / elapsed, errors))
+
+        for chunk in read_chunks(args.input, done, args.chunk_size):
+            if len(pending) >= args.parallel:
+                write_next()
+            pending.append(executor.submit(send_chunk, client, url, chunk))
+        while pending:
+            write_next()
+
+    print('Done: {} docs written to {}, {} errors.'.format(written, args.output, errors))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a jsonl corpus through the pipeline.')
+    parser.add_argument(
+        "--input", type=str, required=True, help="docs (.jsonl)",
+    )
+    parser.add_argument(
+        "--output", type=str, required=True, help="annotated docs (.jsonl), appended to when resuming",
+    )
+    parser.add_argument(
+        "--pipeline", type=str, default="http://127.0.0.1:30310", help="pipeline baseurl",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=200, help="docs per request", dest="chunk_size",
+    )
+    parser.add_argument(
+        "--parallel", type=int, default=2, help="requests in flight",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=3600, help="seconds to wait for a chunk",
+    )
+
+    run(parser.parse_args())
@@ -0,0 +1,60 @@
+import asyncio
+
+class StageBatcher:
+    """
+    Collects the payloads sent to a stage for up to `max_wait` seconds (or until `max_batch`
+    payloads) and sends them with one call. `func(payloads)` is a coroutine returning one output per payload.
+    """
+    def __init__(self, func, max_wait, max_batch):
+        self.func = func
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.batches = 0
+        self.requests = 0
+        self._pending = []
+        self._timer = None
+
+    async def submit(self, payload):
+        """
+        Waits for the output of `payload`.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((payload, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._send(batch))
+
+    async def _send(self, batch):
+        self.batches += 1
+        self.requests += len(batch)
+        try:
+            outputs = await self.func([payload for payload, _ in batch])
+            if not isinstance(outputs, list) or len(outputs) != len(batch):
+                raise Exception('{} outputs for a batch of {}'.format(
+                    len(outputs) if isinstance(outputs, list) else type(outputs).__name__, len(batch)))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), output in zip(batch, outputs):
+            # cancelled when its doc was abandoned
+            if not future.done():
+                future.set_result(output)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'requests': self.requests,
+            'requests_per_batch': self.requests / self.batches if self.batches else 0.0
+        }
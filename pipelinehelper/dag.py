@@ -0,0 +1,85 @@
+import json
+
+# The pipeline is a DAG of stages read from a json config (see pipeline.json):
+# {"stages": [{"name": ..., "url": ..., ...}, ...]} with, for each stage,
+#   name        the service: its connection pool, --service-timeouts and --skip-stages name
+#   url         absolute or relative to --api-baseurl (the --api-<stage> flags override it)
+#   batch_url   url taking a list of docs (optional): used by /api/pipeline/batch
+#   marker      what the stage appends to the pipeline feature (default: name); stages already there are skipped
+#   inputs      annotation sets sent to the stage, null for all of them.
+#               "annsets_to_link" stands for the set named by the annsets_to_link feature
+#   outputs     annotation sets written by the stage
+#   depends_on  stages to wait for
+#   timeout     seconds (default: --timeout)
+#   optional    on errors the pipeline goes on without its output (default: false)
+#   vectors     exchanges the encodings as binary attachments with --binary-vectors (default: false)
+#   error       message of the exception raised when the stage fails (default: "<name> error")
+
+ANNSETS_TO_LINK = 'annsets_to_link'
+
+DEFAULTS = {
+    'batch_url': None,
+    'inputs': None,
+    'outputs': [],
+    'depends_on': [],
+    'timeout': None,
+    'optional': False,
+    'vectors': False
+}
+
+def load_stages(path):
+    """
+    Reads the stages of the config at `path`, sorted so that every stage follows its dependencies.
+    """
+    with open(path) as fd:
+        config = json.load(fd)
+    stages = {}
+    for stage in config['stages']:
+        assert 'name' in stage and 'url' in stage, 'Error! Stages need a name and a url: {}.'.format(stage)
+        assert stage['name'] not in stages, 'Error! Stage {} defined twice.'.format(stage['name'])
+        stages[stage['name']] = {
+            **DEFAULTS,
+            'marker': stage['name'],
+            'error': '{} error'.format(stage['name']),
+            **stage
+        }
+    for stage in stages.values():
+        for dependency in stage['depends_on']:
+            assert dependency in stages, 'Error! Stage {} depends on the unknown stage {}.'.format(
+                stage['name'], dependency)
+    check_inputs(stages)
+    return sort_stages(stages)
+
+def sort_stages(stages):
+    # topological sort, in config order among the stages ready at the same time
+    done = set()
+    ordered = []
+    remaining = list(stages.values())
+    while remaining:
+        ready = [stage for stage in remaining if all(d in done for d in stage['depends_on'])]
+        assert ready, 'Error! Cyclic dependencies among the stages {}.'.format(
+            ', '.join(stage['name'] for stage in remaining))
+        for stage in ready:
+            remaining.remove(stage)
+            done.add(stage['name'])
+            ordered.append(stage)
+    return ordered
+
+def ancestors(stages, name):
+    found = set()
+    todo = list(stages[name]['depends_on'])
+    while todo:
+        dependency = todo.pop()
+        if dependency not in found:
+            found.add(dependency)
+            todo.extend(stages[dependency]['depends_on'])
+    return found
+
+def check_inputs(stages):
+    # warns only: the set may come with the doc
+    for stage in stages.values():
+        for annset in stage['inputs'] or []:
+            if annset == ANNSETS_TO_LINK:
+                continue
+            if not any(annset in stages[a]['outputs'] for a in ancestors(stages, stage['name'])):
+                print('Warning! No stage before {} outputs {}.'.format(stage['name'], annset))
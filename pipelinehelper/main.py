@@ -1,111 +1,343 @@
 import pandas as pd
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import uvicorn
 from typing import List, Optional, Dict
 import argparse
-import requests
+import asyncio
+import collections
+import functools
+import httpx
 import numpy as np
 import os
+import json
 from gatenlp import Document
+from dag import load_stages, ANNSETS_TO_LINK
+from batcher import StageBatcher
+from gatenlp_vectors import vector_encode, pack_doc, unpack_doc, VECTORS_MEDIA_TYPE
+from gatenlp_delta import DELTA_HEADER
 
 class Req(BaseModel):
     doc_id: int # doc id
     skip_pipeline: List[str] = [] # to skip components: the component names in the list will be skipped
     rename_set: Dict = {} # to rename annotation sets #TODO
 
+# one pool of keep-alive connections per downstream service (see make_clients)
+clients = {}
+# connection failures and these statuses are retried with exponential backoff
+RETRY_STATUSES = [502, 503, 504]
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+def make_clients(args):
+    limits = httpx.Limits(max_connections=args.pool_size, max_keepalive_connections=args.pool_size)
+    return {service: httpx.AsyncClient(limits=limits) for service in SERVICES}
+
+def service_timeout(service):
+    # --service-timeouts, then the timeout of the stage (see __main__)
+    return args.service_timeouts.get(service, args.timeout)
+
+async def call(service, url, method='POST', retry=True, **kwargs):
+    """
+    Requests `url` with the client of `service` (its timeout, retries unless `retry` is False).
+    Transport errors raise Exception like the error responses of the stages.
+    """
+    attempts = args.retries + 1 if retry else 1
+    for attempt in range(attempts):
+        last = attempt == attempts - 1
+        try:
+            res = await clients[service].request(method, url, timeout=service_timeout(service), **kwargs)
+            if last or res.status_code not in RETRY_STATUSES:
+                return res
+            print('{} error {}. Retrying...'.format(service, res.status_code))
+        except RETRY_ERRORS as e:
+            if last:
+                raise Exception('{} error: {!r}'.format(service, e))
+            print('{} error {!r}. Retrying...'.format(service, e))
+        except httpx.HTTPError as e:
+            raise Exception('{} error: {!r}'.format(service, e))
+        await asyncio.sleep(args.retry_backoff * 2 ** attempt)
+
+def stage_payload(doc, stage):
+    """
+    The part of `doc` (dict) read by `stage`: text, features and its input annotation sets.
+    """
+    names = stage['inputs']
+    annsets = doc['annotation_sets']
+    if not args.full_payloads and names is not None:
+        names = [doc['features'].get('annsets_to_link', 'entities_merged') if name == ANNSETS_TO_LINK else name
+            for name in names]
+        annsets = {name: annsets[name] for name in names if name in annsets}
+    # copies: the outputs are compared with what was sent while `doc` changes
+    return {**doc, 'annotation_sets': dict(annsets), 'features': dict(doc['features'])}
+
+def merge_stage_output(doc, original, stage_doc):
+    """
+    Adds to `doc` (dict) the annotation sets and features that a stage added to (or changed in) `original`.
+    `stage_doc` is either a whole doc or a delta. Returns the names of the sets and what the stage appended to the pipeline feature.
+    """
+    names = []
+    for name, annset in stage_doc.get('annotation_sets', {}).items():
+        if original['annotation_sets'].get(name) != annset:
+            doc['annotation_sets'][name] = annset
+            names.append(name)
+    done = len(original['features'].get('pipeline', []))
+    markers = []
+    for key, value in stage_doc.get('features', {}).items():
+        if key == 'pipeline':
+            # the stages append their name
+            markers = value[done:]
+            doc['features']['pipeline'] = doc['features'].get('pipeline', []) + markers
+        elif original['features'].get(key) != value:
+            doc['features'][key] = value
+    return names, markers
+
+def sort_outputs(doc, done, set_ranks, appended):
+    """
+    Orders the annotation sets and the pipeline feature of `doc` as if the stages had finished one at a time,
+    in their order: the stages reading several sets (e.g. mergener) get them in the same order every time.
+    `done` is the pipeline feature before the stages, `set_ranks` the rank of the stage of each set
+    and `appended` the pipeline entries of each rank.
+    """
+    order = sorted(doc['annotation_sets'], key=lambda name: set_ranks.get(name, -1))
+    doc['annotation_sets'] = {name: doc['annotation_sets'][name] for name in order}
+    doc['features']['pipeline'] = done + [m for rank in sorted(appended) for m in appended[rank]]
+
+async def send_batch(stage, payloads):
+    """
+    Posts the payloads of several docs to the batch url of `stage`. Returns a (response, output) per payload.
+    """
+    headers = {} if args.full_payloads else {DELTA_HEADER: 'true'}
+    res = await call(stage['name'], stage['batch_url'], json=payloads, headers=headers)
+    if not res.is_success:
+        return [(res, None)] * len(payloads)
+    outputs = res.json()
+    if not isinstance(outputs, list) or len(outputs) != len(payloads):
+        raise Exception('{} error: not one output per doc of the batch'.format(stage['name']))
+    return [(res, output) for output in outputs]
+
+async def send_doc(stage, doc, vectors=None, batch=False):
+    """
+    Posts the part of the doc read by `stage` as JSON or, when vectors is not None, with the
+    binary transport. Returns (response, payload, output, vectors) where output is None on errors.
+    With `batch` the doc goes with the others waiting for the stage, when it has a batch url.
+    """
+    payload = stage_payload(doc, stage)
+    if batch and stage['name'] in batchers:
+        res, res_doc = await batchers[stage['name']].submit(payload)
+        return res, payload, res_doc, None
+    headers = {}
+    if not args.full_payloads:
+        headers[DELTA_HEADER] = 'true'
+    if batch or not (stage['vectors'] and args.binary_vectors):
+        # batches are json only
+        vectors = None
+    elif vectors is None:
+        # to get the encodings as an attachment
+        headers['accept'] = VECTORS_MEDIA_TYPE
+    if vectors is None:
+        res = await call(stage['name'], stage['url'], json=payload, headers=headers)
+    else:
+        headers['content-type'] = VECTORS_MEDIA_TYPE
+        res = await call(stage['name'], stage['url'], content=pack_doc(payload, vectors), headers=headers)
+    if not res.is_success:
+        return res, payload, None, vectors
+    if res.headers.get('content-type', '').startswith(VECTORS_MEDIA_TYPE):
+        res_doc, vectors = unpack_doc(res.content)
+    else:
+        res_doc = res.json()
+    return res, payload, res_doc, vectors
+
+def inline_vectors(doc, vectors):
+    """
+    Replaces the {'vector': row} references with base64 (or quantized) encodings.
+    """
+    if vectors is None:
+        return doc
+    for annset in doc['annotation_sets'].values():
+        for annotation in annset['annotations']:
+            linking = annotation.get('features', {}).get('linking')
+            if linking and isinstance(linking.get('encoding'), dict) and 'vector' in linking['encoding']:
+                enc = linking['encoding']
+                data = vector_encode(np.ascontiguousarray(vectors[enc['vector']]))
+                if vectors.dtype == np.float32:
+                    linking['encoding'] = data
+                else:
+                    # quantized encoding
+                    linking['encoding'] = {'data': data, 'dtype': str(vectors.dtype)}
+                    if enc.get('scale') is not None:
+                        linking['encoding']['scale'] = enc['scale']
+    return doc
+
+def remove_encodings(doc):
+    # before saving to db
+    for annset in doc['annotation_sets'].values():
+        for anno in annset['annotations']:
+            if 'features' in anno and 'linking' in anno['features'] \
+                    and 'encoding' in anno['features']['linking']:
+                del anno['features']['linking']['encoding']
+
 app = FastAPI()
 
+@app.on_event('shutdown')
+async def close_clients():
+    for client in clients.values():
+        await client.aclose()
+
 @app.post('/api/pipeline/reannotate')
 async def run(req: Req):
 
-    res_doc = requests.get(args.mongo + f'/document/anon/{req.doc_id}')
-    assert res_doc.ok
+    res_doc = await call('mongo', args.mongo + f'/document/anon/{req.doc_id}', method='GET')
+    assert res_doc.is_success
 
-    doc = res_doc.json()
-    doc = Document.from_dict(doc)
+    doc = Document.from_dict(res_doc.json()).to_dict()
 
-    doc.features['pipeline'] = req.skip_pipeline
+    doc['features']['pipeline'] = req.skip_pipeline
 
-    doc.features['save'] = False
-    doc.features['reannotate'] = True
-    doc.features['rename_set'] = req.rename_set
+    doc['features']['save'] = False
+    doc['features']['reannotate'] = True
+    doc['features']['rename_set'] = req.rename_set
 
-    return run(doc, req.doc_id)
+    return await run(doc, req.doc_id)
 
 
 @app.post('/api/pipeline')
 async def run_pipeline(doc: dict = Body(...)):
-    doc = Document.from_dict(doc)
-    return run(doc)
-
-def run(doc, doc_id = None):
-    if not 'pipeline' in doc.features:
-        doc.features['pipeline'] = []
-
-    if 'sectionator' in doc.features['pipeline']:
-        print('Skipping sectionator: already done')
-    else:
-        res_ner = requests.post(args.sectionator, json=doc.to_dict())
-        if not res_ner.ok:
-            raise Exception('sectionator error')
-        doc = Document.from_dict(res_ner.json())
-
-    if 'spacyner' in doc.features['pipeline']:
-        print('Skipping spacyner: already done')
-    else:
-        res_ner = requests.post(args.spacyner, json=doc.to_dict())
-        if not res_ner.ok:
-            raise Exception('spacyNER error')
-        doc = Document.from_dict(res_ner.json())
-
-    if 'tintner' in doc.features['pipeline']:
-        print('Skipping tintner: already done')
-    else:
-        res_ner = requests.post(args.tintner, json=doc.to_dict())
-        if not res_ner.ok:
-            raise Exception('tintNER error')
-        doc = Document.from_dict(res_ner.json())
-
-    if 'triener' in doc.features['pipeline']:
-        print('Skipping triener: already done')
-    else:
-        res_ner = requests.post(args.triener, json=doc.to_dict())
-        if not res_ner.ok:
-            raise Exception('trieNER error')
-        doc = Document.from_dict(res_ner.json())
-
-    if 'mergener' in doc.features['pipeline']:
-        print('Skipping mergener: already done')
-    else:
-        res_ner = requests.post(args.mergener, json=doc.to_dict())
-        if not res_ner.ok:
-            raise Exception('mergeNER error')
-        doc = Document.from_dict(res_ner.json())
-
-    if 'biencoder' in doc.features['pipeline']:
-        print('Skipping biencoder: already done')
-    else:
-        res_biencoder = requests.post(args.biencoder_mention, json=doc.to_dict())
-        if not res_biencoder.ok:
-            raise Exception('Biencoder errror')
-        doc = Document.from_dict(res_biencoder.json())
-
-    if 'indexer' in doc.features['pipeline']:
-        print('Skipping indexer: already done')
-    else:
-        res_indexer = requests.post(args.indexer_search, json=doc.to_dict())
-        if not res_indexer.ok:
-            raise Exception('Indexer error')
-        doc = Document.from_dict(res_indexer.json())
-
-    if 'nilprediction' in doc.features['pipeline']:
-        print('Skipping nilprediction: already done')
-    else:
-        res_nilprediction = requests.post(args.nilpredictor, json=doc.to_dict())
-        if not res_nilprediction.ok:
-            raise Exception('NIL prediction error')
-        doc = Document.from_dict(res_nilprediction.json())
+    # parsed once to fill in the missing fields: the stages work on the dict
+    doc = Document.from_dict(doc).to_dict()
+    return await run(doc)
+
+def read_docs(body):
+    """
+    The docs of a json list or the lines of jsonl (parsed by run_batch_doc, to report the errors per doc).
+    """
+    if body.lstrip()[:1] == b'[':
+        return json.loads(body)
+    return [line for line in body.splitlines() if line.strip()]
+
+async def run_batch_doc(doc):
+    if not isinstance(doc, dict):
+        doc = json.loads(doc)
+    doc = Document.from_dict(doc).to_dict()
+    return await run(doc, batch=True)
+
+async def result_line(task):
+    try:
+        doc = await task
+    except Exception as e:
+        doc = {'error': str(e)}
+    return json.dumps(doc) + '\n'
+
+async def run_batch(docs):
+    """
+    Yields the ndjson lines of the docs, in their order, with up to --batch-concurrency docs in the pipeline.
+    A doc failing is an {"error": ...} line.
+    """
+    pending = collections.deque()
+    try:
+        for doc in docs:
+            if len(pending) >= args.batch_concurrency:
+                yield await result_line(pending.popleft())
+            pending.append(asyncio.ensure_future(run_batch_doc(doc)))
+        while pending:
+            yield await result_line(pending.popleft())
+    finally:
+        # the client is gone
+        for task in pending:
+            task.cancel()
+
+@app.post('/api/pipeline/batch')
+async def run_pipeline_batch(request: Request):
+    # a json list of docs or jsonl, answered with ndjson (see batch.py).
+    # The body is read first: the response streams while the docs go through the pipeline
+    docs = read_docs(await request.body())
+    return StreamingResponse(run_batch(docs), media_type='application/x-ndjson')
+
+@app.get('/api/pipeline/batch/stats')
+async def batch_stats():
+    return {name: batcher.stats() for name, batcher in batchers.items()}
+
+# the stages of the pipeline (see dag.py), in dependency order
+stages = []
+# the services with a connection pool: the stages and the ones called by run() (see __main__)
+SERVICES = []
+# the StageBatcher of each stage with a batch url
+batchers = {}
+
+async def run_stage(stage, doc, vectors, batch):
+    # the exceptions of the required stages stop the pipeline
+    try:
+        return await send_doc(stage, doc, vectors, batch)
+    except Exception as e:
+        if not stage['optional']:
+            raise
+        print('{} failed: {}'.format(stage['name'], e))
+        return None, None, None, None
+
+async def run_stages(doc, batch=False):
+    """
+    Calls the stages not done yet, each one as soon as the stages it depends on are over: the
+    independent ones run concurrently. Returns the doc and the vectors of the binary transport (or None).
+    """
+    # disabled for the deployment or the request
+    disabled = set(args.skip_stages) | set(doc['features'].get('skip_stages', []))
+    over = set()
+    todo = []
+    for stage in stages:
+        if stage['marker'] in doc['features']['pipeline']:
+            print('Skipping {}: already done'.format(stage['name']))
+            over.add(stage['name'])
+        elif stage['name'] in disabled:
+            print('Skipping {}: disabled'.format(stage['name']))
+            over.add(stage['name'])
+        else:
+            todo.append(stage)
+
+    vectors = None
+    running = {}
+    done = list(doc['features']['pipeline'])
+    set_ranks = {}
+    appended = {}
+    try:
+        while todo or running:
+            for stage in [s for s in todo if all(d in over for d in s['depends_on'])]:
+                todo.remove(stage)
+                running[asyncio.ensure_future(run_stage(stage, doc, vectors, batch))] = stage
+            finished, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                stage = running.pop(task)
+                over.add(stage['name'])
+                res, payload, stage_doc, stage_vectors = task.result()
+                if stage_doc is None:
+                    if not stage['optional']:
+                        raise Exception(stage['error'])
+                    if res is not None:
+                        print('{} failed: status {}'.format(stage['name'], res.status_code))
+                    continue
+                names, markers = merge_stage_output(doc, payload, stage_doc)
+                # whatever the order they finish in
+                rank = stages.index(stage)
+                set_ranks.update({name: rank for name in names})
+                appended[rank] = markers
+                sort_outputs(doc, done, set_ranks, appended)
+                if stage['vectors'] and stage_vectors is not None:
+                    vectors = stage_vectors
+    finally:
+        for task in running:
+            task.cancel()
+    return doc, vectors
+
+@app.get('/api/pipeline/stages')
+async def get_stages():
+    return stages
+
+async def run(doc, doc_id = None, batch = False):
+    # every call awaits its service: the other documents go on meanwhile
+    if not 'pipeline' in doc['features']:
+        doc['features']['pipeline'] = []
+
+    # vectors is not None when the encodings travel as a binary attachment
+    doc, vectors = await run_stages(doc, batch)
 
     # # if top_candidate is not NIL, then set its type as NER type #TODO study if ner is the correct place for the type
     # for annset_name in doc.annset_names():
@@ -124,65 +356,43 @@ def run(doc, doc_id = None):
     #                 annotation._type = annotation.features['linking']['top_candidate']['type_']
     # # TODO ensure consistency between types
 
-    if 'nilclustering' in doc.features['pipeline']:
-        print('Skipping nilclustering: already done')
-    else:
-        res_clustering = requests.post(args.nilcluster, json=doc.to_dict())
-        if not res_clustering.ok:
-            raise Exception('Clustering error')
-        doc = Document.from_dict(res_clustering.json())
+    # back to base64 encodings for the services (and clients) speaking JSON only
+    doc = inline_vectors(doc, vectors)
 
-    if doc.features.get('populate', False):
+    if doc['features'].get('populate', False):
         # get clusters
-        res_populate = requests.post(args.indexer_add, json=doc.to_dict())
-        if not res_populate.ok:
+        # adds are not retried
+        res_populate = await call('indexer', args.indexer_add, retry=False, json=doc)
+        if not res_populate.is_success:
             raise Exception('Population error')
-        doc = Document.from_dict(res_populate.json())
+        doc = res_populate.json()
 
-    if doc.features.get('reannotate', False):
-        dict_to_save = doc.to_dict()
-        # remove encodings before saving to db
-        for annset in dict_to_save['annotation_sets'].values():
-            for anno in annset['annotations']:
-                if 'features' in anno and 'linking' in anno['features'] \
-                        and 'encoding' in anno['features']['linking']:
-                    del anno['features']['linking']['encoding']
+    if doc['features'].get('reannotate', False):
+        remove_encodings(doc)
 
         # rename annotation sets
-        new_dict_to_save = dict_to_save.copy()
-        del new_dict_to_save['annotation_sets']
-        new_dict_to_save['annotation_sets'] = {}
-        for annset_name, annset in dict_to_save['annotation_sets'].items():
+        dict_to_save = {**doc, 'annotation_sets': {}}
+        for annset_name, annset in doc['annotation_sets'].items():
             # if in rename --> rename; otherwise --> old annset_name
-            new_name = dict_to_save['features'].get('rename_set', {}).get(annset_name, annset_name)
+            new_name = doc['features'].get('rename_set', {}).get(annset_name, annset_name)
 
-            annset['name'] = new_name
+            dict_to_save['annotation_sets'][new_name] = {**annset, 'name': new_name}
 
-            new_dict_to_save['annotation_sets'][new_name] = annset
-
-        dict_to_save = new_dict_to_save
-
-        res_save = requests.post(args.mongo + f'/document/{doc_id}', json=dict_to_save)
-        if not res_save.ok:
+        res_save = await call('mongo', args.mongo + f'/document/{doc_id}', retry=False, json=dict_to_save)
+        if not res_save.is_success:
             raise Exception('Reannotate error')
 
-    if doc.features.get('save', False):
-        dict_to_save = doc.to_dict()
-        # remove encodings before saving to db
-        for annset in dict_to_save['annotation_sets'].values():
-            for anno in annset['annotations']:
-                if 'features' in anno and 'linking' in anno['features'] \
-                        and 'encoding' in anno['features']['linking']:
-                    del anno['features']['linking']['encoding']
-        res_save = requests.post(args.mongo + '/document', json=dict_to_save)
-        if not res_save.ok:
+    if doc['features'].get('save', False):
+        remove_encodings(doc)
+        res_save = await call('mongo', args.mongo + '/document', retry=False, json=doc)
+        if not res_save.is_success:
             raise Exception('Save error')
 
-    if not 'pipeline' in doc.features:
-        doc.features['pipeline'] = []
-    doc.features['pipeline'].append('pipeline')
+    if not 'pipeline' in doc['features']:
+        doc['features']['pipeline'] = []
+    doc['features']['pipeline'].append('pipeline')
 
-    return doc.to_dict()
+    return doc
 
 if __name__ == '__main__':
 
@@ -194,6 +404,19 @@ if __name__ == '__main__':
     else:
         auth = None
 
+    # the --api-<stage> flags override the urls of these stages
+    STAGE_URL_ARGS = {
+        'sectionator': 'sectionator',
+        'spacyner': 'spacyner',
+        'tintner': 'tintner',
+        'triener': 'triener',
+        'mergener': 'mergener',
+        'biencoder': 'biencoder_mention',
+        'indexer': 'indexer_search',
+        'nilpredictor': 'nilpredictor',
+        'nilcluster': 'nilcluster'
+    }
+
     parser = argparse.ArgumentParser()
 
     parser.add_argument(
@@ -247,36 +470,80 @@ if __name__ == '__main__':
     parser.add_argument(
         "--api-mongo", type=str, default=None, help="mongo URL", dest='mongo', required=False
     )
+    parser.add_argument(
+        "--pipeline-config", type=str, default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pipeline.json'), help="The stages of the pipeline (see dag.py)", dest='pipeline_config'
+    )
+    parser.add_argument(
+        "--skip-stages", type=str, default="", help="Stages not to run, e.g. tintner,triener (the skip_stages feature of a doc does the same for that doc)", dest='skip_stages'
+    )
+    parser.add_argument(
+        "--binary-vectors", action='store_true', default=False, help="Exchange encodings as binary attachments with biencoder, indexer and nilcluster", dest='binary_vectors'
+    )
+    parser.add_argument(
+        "--full-payloads", action='store_true', default=False, help="Send the whole doc to every stage and expect it back (no delta payloads)", dest='full_payloads'
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=16, help="Max docs per call to the batch url of a stage (/api/pipeline/batch)", dest='batch_size'
+    )
+    parser.add_argument(
+        "--batch-wait", type=float, default=0.05, help="Seconds to wait for more docs before calling the batch url of a stage", dest='batch_wait'
+    )
+    parser.add_argument(
+        "--batch-concurrency", type=int, default=32, help="Docs of a /api/pipeline/batch request in the pipeline at the same time", dest='batch_concurrency'
+    )
+    parser.add_argument(
+        "--pool-size", type=int, default=20, help="Max (keep-alive) connections to each service", dest='pool_size'
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=600, help="Seconds to wait for a service", dest='timeout'
+    )
+    parser.add_argument(
+        "--service-timeouts", type=str, default="", help="Per service timeouts, e.g. tintner=900,indexer=60 (services: the stages, indexer and mongo)", dest='service_timeouts'
+    )
+    parser.add_argument(
+        "--retries", type=int, default=2, help="Retries of the calls failing to connect or answering 502/503/504 (adds and saves are not retried)", dest='retries'
+    )
+    parser.add_argument(
+        "--retry-backoff", type=float, default=0.5, help="Seconds before the first retry, doubled at each one", dest='retry_backoff'
+    )
 
     args = parser.parse_args()
 
-    if args.sectionator is None:
-        args.sectionator = args.baseurl + '/api/sectionator'
-    if args.spacyner is None:
-        args.spacyner = args.baseurl + '/api/spacyner'
-    if args.tintner is None:
-        args.tintner = args.baseurl + '/api/tintner'
-    if args.triener is None:
-        args.triener = args.baseurl + '/api/triener'
-    if args.mergener is None:
-        args.mergener = args.baseurl + '/api/mergesets/doc'
-    if args.biencoder_mention is None:
-        args.biencoder_mention = args.baseurl + '/api/blink/biencoder/mention/doc'
     if args.biencoder_entity is None:
         args.biencoder_entity = args.baseurl + '/api/blink/biencoder/entity'
     if args.crossencoder is None:
         args.crossencoder = args.baseurl + '/api/blink/crossencoder'
-    if args.indexer_search is None:
-        args.indexer_search = args.baseurl + '/api/indexer/search/doc'
     if args.indexer_add is None:
         args.indexer_add = args.baseurl + '/api/indexer/add/doc'
     if args.indexer_reset is None:
         args.indexer_reset = args.baseurl + '/api/indexer/reset/rw'
-    if args.nilpredictor is None:
-        args.nilpredictor = args.baseurl + '/api/nilprediction/doc'
-    if args.nilcluster is None:
-        args.nilcluster = args.baseurl + '/api/nilcluster/doc'
     if args.mongo is None:
         args.mongo = args.baseurl + '/api/mongo'
 
+    stages = load_stages(args.pipeline_config)
+    for stage in stages:
+        url = getattr(args, STAGE_URL_ARGS.get(stage['name'], ''), None)
+        if url is None:
+            url = stage['url'] if '://' in stage['url'] else args.baseurl + stage['url']
+        stage['url'] = url
+        if stage['batch_url'] is not None and '://' not in stage['batch_url']:
+            stage['batch_url'] = args.baseurl + stage['batch_url']
+    SERVICES = list(dict.fromkeys([stage['name'] for stage in stages] + ['indexer', 'mongo']))
+
+    args.skip_stages = list(filter(None, args.skip_stages.split(',')))
+    for name in args.skip_stages:
+        assert any(stage['name'] == name for stage in stages), 'Error! Unknown stage {}.'.format(name)
+
+    # the timeouts of the config, unless given by --service-timeouts
+    service_timeouts = {stage['name']: stage['timeout'] for stage in stages if stage['timeout'] is not None}
+    for item in filter(None, args.service_timeouts.split(',')):
+        service, timeout = item.split('=')
+        assert service in SERVICES, 'Error! Unknown service {}.'.format(service)
+        service_timeouts[service] = float(timeout)
+    args.service_timeouts = service_timeouts
+
+    clients = make_clients(args)
+    batchers = {stage['name']: StageBatcher(functools.partial(send_batch, stage), args.batch_wait, args.batch_size)
+        for stage in stages if stage['batch_url'] is not None}
+
     uvicorn.run(app, host = args.host, port = args.port)
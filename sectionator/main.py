@@ -1,8 +1,9 @@
 import argparse
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, Request
 import uvicorn
 import re
 from gatenlp import Document
+from gatenlp_delta import delta_doc
 import pandas as pd
 
 def identify_sections(doc):
@@ -80,12 +81,12 @@ def add_sections_to_gatenlp(gnlp_doc):
 app = FastAPI()
 
 @app.post('/api/sectionator')
-async def sectionator(doc: dict = Body(...)):
+async def sectionator(request: Request, doc: dict = Body(...)):
     doc = Document.from_dict(doc)
 
     add_sections_to_gatenlp(doc)
 
-    return doc.to_dict()
+    return delta_doc(request, doc.to_dict(), ['Sections'])
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
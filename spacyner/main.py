@@ -1,11 +1,12 @@
 import argparse
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, Request
 from pydantic import BaseModel
 import uvicorn
 import spacy
 from spacy.cli import download as spacy_download
 
 from gatenlp import Document
+from gatenlp_delta import delta_doc
 
 DEFAULT_TAG='aplha_v0.1.0_spacy'
 
@@ -18,7 +19,7 @@ def restructure_newline(text):
   return text.replace('\n', ' ')
 
 @app.post('/api/spacyner')
-async def encode_mention(doc: dict = Body(...)):
+async def encode_mention(request: Request, doc: dict = Body(...)):
 
     # replace wrong newlines
     text = restructure_newline(doc['text'])
@@ -59,7 +60,7 @@ async def encode_mention(doc: dict = Body(...)):
         doc.features['pipeline'] = []
     doc.features['pipeline'].append('spacyner')
 
-    return doc.to_dict()
+    return delta_doc(request, doc.to_dict(), ['entities_{}'.format(args.tag), 'sentences_{}'.format(args.tag)])
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -1,5 +1,5 @@
 import argparse
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, Request
 from pydantic import BaseModel
 import uvicorn
 from typing import Union, List
@@ -11,6 +11,7 @@ import requests
 from entity import EntityMention
 
 from gatenlp import Document
+from gatenlp_delta import delta_doc
 
 DEFAULT_TAG='aplha_v0.1.0_tint'
 
@@ -23,7 +24,7 @@ def restructure_newline(text):
   return text.replace('\n', ' ')
 
 @app.post('/api/tintner')
-async def encode_mention(doc: dict = Body(...)):
+async def encode_mention(request: Request, doc: dict = Body(...)):
 
     # replace wrong newlines
     text = restructure_newline(doc['text'])
@@ -60,7 +61,7 @@ async def encode_mention(doc: dict = Body(...)):
         doc.features['pipeline'] = []
     doc.features['pipeline'].append('tintner')
 
-    return doc.to_dict()
+    return delta_doc(request, doc.to_dict(), [f'entities_{DEFAULT_TAG}'])
 
 def nlp_tint(text):
     global args
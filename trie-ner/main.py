@@ -1,18 +1,19 @@
 import uvicorn
 import argparse
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, Request
 from pydantic import BaseModel
 from TrieNER import TrieNER
 from typing import List, Optional, Dict
 from pathlib import Path
 from datetime import datetime
+from gatenlp_delta import delta_doc
 
 app = FastAPI()
 
 ANN_SET_NAME = 'entities_trie_ner_v1.0.0'
 
 @app.post('/api/triener')
-async def run(doc: dict = Body(...)):
+async def run(request: Request, doc: dict = Body(...)):
   annotations = tner.find_matches(doc['text'])
 
   ann_set = {
@@ -23,7 +24,7 @@ async def run(doc: dict = Body(...)):
 
   doc['annotation_sets'][ANN_SET_NAME] = ann_set
 
-  return doc
+  return delta_doc(request, doc, [ANN_SET_NAME])
 
 
 if __name__ == '__main__':